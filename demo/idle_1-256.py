@@ -1,13 +1,17 @@
 import time
-import types
 
 from libraries.inputs import frame_delay
+from libraries.masks import ControllerState
 from libraries import net_config as net_cfg
 
 
-def _noop_update(self, dz=net_cfg.stick_deadzone):
-    """Replacement ``update_connection`` method that preserves ``connected``."""
-    pass
+class _AlwaysConnected(ControllerState):
+    """Controller state whose ``update_connection`` preserves ``connected``."""
+
+    __slots__ = ()
+
+    def update_connection(self, dz=net_cfg.stick_deadzone):
+        pass
 
 
 def controller_loop(stop_event, controller_states, slot):
@@ -17,7 +21,7 @@ def controller_loop(stop_event, controller_states, slot):
         state = controller_states[s]
         state.connection_type = 2  # Default to Bluetooth
         state.connected = True
-        state.update_connection = types.MethodType(_noop_update, state)
+        state.__class__ = _AlwaysConnected
 
     while not stop_event.is_set():
         time.sleep(frame_delay)
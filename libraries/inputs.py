@@ -45,6 +45,21 @@ _MISC_BUTTONS = {"home", "touch"}
 # Exported set of all valid button names
 VALID_BUTTONS = _MASK1_BUTTONS | _MASK2_BUTTONS | _MISC_BUTTONS
 
+# Bit for each button name within its mask, looked up instead of calling
+# ``button_mask_1``/``button_mask_2`` with keyword arguments on every press.
+_MASK1_BITS = {name: button_mask_1(**{name: True}) for name in _MASK1_BUTTONS}
+_MASK2_BITS = {name: button_mask_2(**{name: True}) for name in _MASK2_BUTTONS}
+
+
+def _button_masks(button_kwargs) -> tuple[int, int]:
+    """Return ``(buttons1, buttons2)`` masks for truthy ``button_kwargs`` entries."""
+    mask1 = mask2 = 0
+    for name, value in button_kwargs.items():
+        if value:
+            mask1 |= _MASK1_BITS.get(name, 0)
+            mask2 |= _MASK2_BITS.get(name, 0)
+    return mask1, mask2
+
 
 def hold_button(controller_states, slot, **button_kwargs):
     """Press specific buttons on ``controller_states`` until released.
@@ -60,11 +75,10 @@ def hold_button(controller_states, slot, **button_kwargs):
         raise ValueError(f"invalid button(s): {', '.join(sorted(invalid_keys))}")
 
     state = controller_states[slot]
-    mask1_args = {k: button_kwargs.get(k, False) for k in _MASK1_BUTTONS}
-    mask2_args = {k: button_kwargs.get(k, False) for k in _MASK2_BUTTONS}
+    mask1, mask2 = _button_masks(button_kwargs)
 
-    state.buttons1 |= button_mask_1(**mask1_args)
-    state.buttons2 |= button_mask_2(**mask2_args)
+    state.buttons1 |= mask1
+    state.buttons2 |= mask2
     if button_kwargs.get("home"):
         state.home = True
     if button_kwargs.get("touch"):
@@ -83,11 +97,10 @@ def release_button(controller_states, slot, **button_kwargs):
         raise ValueError(f"invalid button(s): {', '.join(sorted(invalid_keys))}")
 
     state = controller_states[slot]
-    mask1_args = {k: button_kwargs.get(k, False) for k in _MASK1_BUTTONS}
-    mask2_args = {k: button_kwargs.get(k, False) for k in _MASK2_BUTTONS}
+    mask1, mask2 = _button_masks(button_kwargs)
 
-    state.buttons1 &= ~button_mask_1(**mask1_args) & 0xFF
-    state.buttons2 &= ~button_mask_2(**mask2_args) & 0xFF
+    state.buttons1 &= ~mask1 & 0xFF
+    state.buttons2 &= ~mask2 & 0xFF
     if button_kwargs.get("home"):
         state.home = False
     if button_kwargs.get("touch"):
@@ -103,13 +116,12 @@ def pulse_button(frame, controller_states, slot, **button_kwargs):
     should remain pressed.
     """
     state = controller_states[slot]
-    mask1_args = {k: button_kwargs.get(k, False) for k in _MASK1_BUTTONS}
-    mask2_args = {k: button_kwargs.get(k, False) for k in _MASK2_BUTTONS}
+    mask1, mask2 = _button_masks(button_kwargs)
     home = bool(button_kwargs.get("home", False))
     touch = bool(button_kwargs.get("touch", False))
 
-    state.buttons1 = button_mask_1(**mask1_args)
-    state.buttons2 = button_mask_2(**mask2_args)
+    state.buttons1 = mask1
+    state.buttons2 = mask2
     state.home = home
     state.touch_button = touch
 
@@ -144,36 +156,18 @@ def pulse_button_xor(frame, controller_states, slot, *buttons, **button_kwargs):
     the ``home`` and ``touch`` buttons. ``frame`` specifies how many 1/60ths of
     a second the toggled state should remain active before reverting.
     """
-    mask1_args: dict[str, bool] = {}
-    mask2_args: dict[str, bool] = {}
-    home_toggle = False
-    touch_toggle = False
+    mask1, mask2 = _button_masks(button_kwargs)
+    home_toggle = bool(button_kwargs.get("home"))
+    touch_toggle = bool(button_kwargs.get("touch"))
 
     for b in buttons:
-        if b in _MASK1_BUTTONS:
-            mask1_args[b] = True
-        elif b in _MASK2_BUTTONS:
-            mask2_args[b] = True
-        elif b == "home":
+        mask1 |= _MASK1_BITS.get(b, 0)
+        mask2 |= _MASK2_BITS.get(b, 0)
+        if b == "home":
             home_toggle = True
         elif b == "touch":
             touch_toggle = True
 
-    for k, v in button_kwargs.items():
-        if not v:
-            continue
-        if k in _MASK1_BUTTONS:
-            mask1_args[k] = True
-        elif k in _MASK2_BUTTONS:
-            mask2_args[k] = True
-        elif k == "home":
-            home_toggle = True
-        elif k == "touch":
-            touch_toggle = True
-
-    mask1 = button_mask_1(**mask1_args)
-    mask2 = button_mask_2(**mask2_args)
-
     state = controller_states[slot]
     if mask1:
         state.buttons1 ^= mask1
@@ -1,3 +1,4 @@
+from array import array
 from typing import Optional, Tuple
 import threading
 
@@ -25,26 +26,26 @@ CONNECTION_TYPES = {
 
 def button_mask_1(share=False, l3=False, r3=False, options=False, up=False, right=False, down=False, left=False):
     return (
-        (0x01 if share else 0) |
-        (0x02 if l3 else 0) |
-        (0x04 if r3 else 0) |
-        (0x08 if options else 0) |
-        (0x10 if up else 0) |
-        (0x20 if right else 0) |
-        (0x40 if down else 0) |
-        (0x80 if left else 0)
+        bool(share)
+        | bool(l3) << 1
+        | bool(r3) << 2
+        | bool(options) << 3
+        | bool(up) << 4
+        | bool(right) << 5
+        | bool(down) << 6
+        | bool(left) << 7
     )
 
 def button_mask_2(l2=False, r2=False, l1=False, r1=False, triangle=False, circle=False, cross=False, square=False):
     return (
-        (0x01 if l2 else 0) |
-        (0x02 if r2 else 0) |
-        (0x04 if l1 else 0) |
-        (0x08 if r1 else 0) |
-        (0x10 if triangle else 0) |
-        (0x20 if circle else 0) |
-        (0x40 if cross else 0) |
-        (0x80 if square else 0)
+        bool(l2)
+        | bool(r2) << 1
+        | bool(l1) << 2
+        | bool(r1) << 3
+        | bool(triangle) << 4
+        | bool(circle) << 5
+        | bool(cross) << 6
+        | bool(square) << 7
     )
 
 def touchpad_input(active=False, touch_id=0, x=0, y=0):
@@ -55,7 +56,7 @@ def touchpad_input(active=False, touch_id=0, x=0, y=0):
         y & 0xFFFF
     )
 
-@dataclass
+@dataclass(slots=True)
 class ControllerState:
     """Current virtual controller state."""
 
@@ -91,13 +92,14 @@ class ControllerState:
     battery: int = 5
 
 
-    # Number of rumble motors and their intensities
+    # Number of rumble motors and their intensities. Stored as fixed-length
+    # arrays so rumble updates can be written in place.
     motor_count: int = net_cfg.motor_count
-    motors: Tuple[int, ...] = field(
-        default_factory=lambda: (0,) * net_cfg.motor_count
+    motors: array = field(
+        default_factory=lambda: array('B', (0,) * net_cfg.motor_count)
     )
-    motor_timestamps: Tuple[float, ...] = field(
-        default_factory=lambda: (0.0,) * net_cfg.motor_count
+    motor_timestamps: array = field(
+        default_factory=lambda: array('d', (0.0,) * net_cfg.motor_count)
     )
 
     _dirty_event: threading.Event | None = field(default=None, repr=False, compare=False)
@@ -118,18 +120,37 @@ class ControllerState:
             and abs(self.R_stick[1] - 128) <= dz
         )
         dpads_zero = self.dpad_analog == (0, 0, 0, 0) and self.face_analog == (0, 0, 0, 0)
-        triggers_zero = all(v == 0 for v in (self.analog_R1, self.analog_L1, self.analog_R2, self.analog_L2))
+        triggers_zero = (self.analog_R1 | self.analog_L1 | self.analog_R2 | self.analog_L2) == 0
         touches_inactive = (
             (self.touchpad_input1 is None or self.touchpad_input1[0] == 0)
             and (self.touchpad_input2 is None or self.touchpad_input2[0] == 0)
         )
-        return all([no_buttons, no_misc, sticks_centered, dpads_zero, triggers_zero, touches_inactive])
+        return (
+            no_buttons
+            and no_misc
+            and sticks_centered
+            and dpads_zero
+            and triggers_zero
+            and touches_inactive
+        )
 
     def update_connection(self, dz: int = stick_deadzone) -> None:
         """Synchronize ``connected`` with current input state using ``dz`` as the
         stick deadzone."""
 
-        self.connected = not self.is_idle(dz)
+        connected = not self.is_idle(dz)
+        # Only assign on change so an unchanged state doesn't signal the
+        # server's dirty event.
+        if connected != self.connected:
+            self.connected = connected
+
+    def advance_packet_num(self) -> None:
+        """Increment ``packet_num`` without signalling the dirty event.
+
+        The server bumps the counter after every update it sends; that is not
+        a state change that should trigger another update.
+        """
+        object.__setattr__(self, "packet_num", (self.packet_num + 1) & 0xFFFFFFFF)
 
     def __setattr__(self, name, value):
         object.__setattr__(self, name, value)
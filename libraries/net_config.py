@@ -1,5 +1,8 @@
+from __future__ import annotations
+
 import random
 import time
+from array import array
 
 from protocols.dsu_constants import PROTOCOL_VERSION
 
@@ -9,20 +12,26 @@ UDP_port = 26760
 DSU_timeout = 5.0
 # Tolerance for analog stick drift when detecting connection status
 stick_deadzone = 3
+# Requested kernel send/receive buffer size for the server socket
+socket_buffer_size = 1 << 20
+# Check the CRC of incoming requests. Setting this to False only takes effect
+# when the server is bound to a loopback address.
+verify_crc = True
 
 # Number of rumble motors supported per controller
 motor_count = 2
 
 # Server state tracking
 server_id = random.randint(0, 0xFFFFFFFF)
-# {addr: {'last_seen': float, 'slots': set(), 'registrations': {...}}}
+# {addr: {'slots': int, 'registrations': {...}, 'protocol_version': int}}
+# where 'slots' has bit ``n`` set once the client has asked about slot ``n``
 active_clients = {}
-# Slots the server has already advertised
-known_slots = set()
+# {addr: float} time of the most recent request from each active client
+client_last_seen = {}
+# Slots the server has already advertised, as a bitmask (bit ``n`` = slot ``n``)
+known_slots = 0
 # Slots we have already logged input requests for
 logged_pad_requests = set()
-# Track last button state per slot so we only log changes
-last_button_states = {}
 
 
 # Unique MAC addresses per controller slot. Entries may be ``None`` to have
@@ -62,6 +71,10 @@ slot_mac_addresses = SlotMacDict({
 # Additional slots may exist internally but cannot be reported to a DSU client.
 soft_slot_limit = 256
 
+# Track last button state per slot so we only log changes. Each entry packs
+# ``(buttons1 << 8) | buttons2``; -1 marks a slot with nothing sent yet.
+last_button_states = array('l', [-1]) * soft_slot_limit
+
 # Track which warnings have been printed so they only show once
 _warned_messages: set[str] = set()
 
@@ -114,9 +127,38 @@ def _registration_defaults() -> dict:
 
 def ensure_client(addr) -> dict:
     """Return client info for ``addr``, creating defaults if needed."""
-    info = active_clients.setdefault(addr, {'last_seen': time.time(), 'slots': set()})
-    info.setdefault('last_seen', time.time())
-    info.setdefault('slots', set())
-    info.setdefault('registrations', _registration_defaults())
-    info.setdefault('protocol_version', PROTOCOL_VERSION)
+    info = active_clients.get(addr)
+    if info is None:
+        info = _new_client(addr, time.time())
+    return info
+
+
+def _new_client(addr, now: float) -> dict:
+    """Create the client info for ``addr`` and mark it seen at ``now``."""
+    info = active_clients[addr] = {
+        'slots': 0,
+        'registrations': _registration_defaults(),
+        'protocol_version': PROTOCOL_VERSION,
+    }
+    client_last_seen.setdefault(addr, now)
     return info
+
+
+def touch_client(addr, now: float | None = None) -> dict:
+    """Record a request from ``addr`` and return its client info."""
+    if now is None:
+        now = time.time()
+    client_last_seen[addr] = now
+    info = active_clients.get(addr)
+    if info is None:
+        info = _new_client(addr, now)
+    return info
+
+
+def drop_client(addr) -> bool:
+    """Forget ``addr``. Returns ``True`` if it was an active client."""
+    # Remove the client entry first so a sweep never sees a client whose
+    # last-seen time is already gone.
+    dropped = active_clients.pop(addr, None) is not None
+    client_last_seen.pop(addr, None)
+    return dropped
@@ -0,0 +1,220 @@
+"""Batched UDP sends and receives.
+
+On Linux :func:`send_batch` hands a list of datagrams to the kernel with a
+single ``sendmmsg(2)`` call and :class:`Receiver` drains several datagrams
+with one ``recvmmsg(2)`` call, both through :mod:`ctypes`. Other platforms
+(or a libc without these calls) fall back to one ``sendto`` or
+``recvfrom_into`` per datagram.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import errno
+import functools
+import os
+import socket
+import struct
+import sys
+
+# Upper bound on datagrams handed to a single ``sendmmsg`` call.
+MAX_BATCH = 64
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", _MsgHdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+
+def _load_libc_func(name: str, extra_argtypes: list):
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        func = getattr(libc, name)
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [
+        ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int,
+    ] + extra_argtypes
+    func.restype = ctypes.c_int
+    return func
+
+
+_sendmmsg = _load_libc_func("sendmmsg", [])
+_recvmmsg = _load_libc_func("recvmmsg", [ctypes.c_void_p])
+
+
+@functools.lru_cache(maxsize=256)
+def _sockaddr(addr: tuple) -> ctypes.Array:
+    """Return a C ``sockaddr_in``/``sockaddr_in6`` buffer for ``addr``."""
+    host, port = addr[0], addr[1]
+    if len(addr) == 2:
+        raw = struct.pack("=H", socket.AF_INET) + struct.pack("!H", port)
+        raw += socket.inet_pton(socket.AF_INET, host) + b"\x00" * 8
+    else:
+        flowinfo, scope_id = addr[2], addr[3]
+        raw = struct.pack("=H", socket.AF_INET6) + struct.pack("!HI", port, flowinfo)
+        raw += socket.inet_pton(socket.AF_INET6, host) + struct.pack("=I", scope_id)
+    return ctypes.create_string_buffer(raw, len(raw))
+
+
+def _send_each(sock: socket.socket, packets) -> int:
+    sent = 0
+    for pkt, addr in packets:
+        try:
+            sock.sendto(pkt, addr)
+        except OSError:
+            if sent:
+                return sent
+            raise
+        sent += 1
+    return sent
+
+
+def send_batch(sock: socket.socket, packets: list) -> int:
+    """Send ``(packet, addr)`` pairs from ``packets`` on ``sock``.
+
+    Returns how many leading datagrams were sent, which may be fewer than
+    requested. ``OSError`` is raised only when the first datagram fails, so
+    callers can report that entry and resume with the remainder.
+    """
+    packets = packets[:MAX_BATCH]
+    if _sendmmsg is None or len(packets) < 2:
+        return _send_each(sock, packets)
+
+    count = len(packets)
+    iovecs = (_IOVec * count)()
+    msgs = (_MMsgHdr * count)()
+    keep = []
+    # A packet fanned out to several clients is queued as the same object,
+    # so its messages can all point at one shared iovec.
+    shared = {}
+    used = 0
+    try:
+        for msg, (pkt, addr) in zip(msgs, packets):
+            iov = shared.get(id(pkt))
+            if iov is None:
+                iov = shared[id(pkt)] = iovecs[used]
+                used += 1
+                if not isinstance(pkt, bytes):
+                    pkt = bytes(pkt)
+                keep.append(pkt)
+                iov.iov_base = ctypes.cast(ctypes.c_char_p(pkt), ctypes.c_void_p)
+                iov.iov_len = len(pkt)
+            name = _sockaddr(addr)
+            hdr = msg.msg_hdr
+            hdr.msg_name = ctypes.cast(name, ctypes.c_void_p)
+            hdr.msg_namelen = len(name)
+            hdr.msg_iov = ctypes.pointer(iov)
+            hdr.msg_iovlen = 1
+    except (OSError, ValueError, TypeError, IndexError):
+        # Unusual address formats are left to the regular socket API.
+        return _send_each(sock, packets)
+
+    sent = _sendmmsg(sock.fileno(), msgs, count, 0)
+    if sent > 0:
+        return sent
+    err = ctypes.get_errno()
+    if sent == 0 or err in (errno.ENOSYS, errno.EINTR):
+        # Let ``sendto`` deliver (or report) the datagram individually.
+        return _send_each(sock, packets[:1])
+    raise OSError(err, os.strerror(err))
+
+
+# Large enough for any ``sockaddr_in``/``sockaddr_in6`` (``sockaddr_storage``).
+_SOCKADDR_SIZE = 128
+
+
+def _parse_sockaddr(raw: bytes) -> tuple:
+    """Return the Python address tuple for a C socket address."""
+    family, = struct.unpack_from("=H", raw)
+    if family == socket.AF_INET:
+        port, = struct.unpack_from("!H", raw, 2)
+        return socket.inet_ntop(socket.AF_INET, raw[4:8]), port
+    if family == socket.AF_INET6:
+        port, flowinfo = struct.unpack_from("!HI", raw, 2)
+        scope_id, = struct.unpack_from("=I", raw, 24)
+        return socket.inet_ntop(socket.AF_INET6, raw[8:24]), port, flowinfo, scope_id
+    raise OSError(errno.EAFNOSUPPORT, os.strerror(errno.EAFNOSUPPORT))
+
+
+class Receiver:
+    """Reusable buffers for draining a non-blocking UDP socket in batches.
+
+    :meth:`recv` returns ``(view, nbytes, addr)`` entries where ``view`` is a
+    :class:`memoryview` over one of the receive buffers. Views are only valid
+    until the next call.
+    """
+
+    def __init__(self, count: int = 32, size: int = 2048) -> None:
+        if _recvmmsg is None:
+            count = 1
+        self._buffers = [bytearray(size) for _ in range(count)]
+        self._views = [memoryview(buf) for buf in self._buffers]
+        self._count = count
+        if _recvmmsg is None:
+            return
+        self._names = (ctypes.c_char * (_SOCKADDR_SIZE * count))()
+        self._iovecs = (_IOVec * count)()
+        self._msgs = (_MMsgHdr * count)()
+        base = ctypes.addressof(self._names)
+        for i, buf in enumerate(self._buffers):
+            iov = self._iovecs[i]
+            iov.iov_base = ctypes.addressof((ctypes.c_char * size).from_buffer(buf))
+            iov.iov_len = size
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = base + i * _SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(iov)
+            hdr.msg_iovlen = 1
+
+    def recv(self, sock: socket.socket) -> list:
+        """Receive up to ``count`` datagrams without blocking.
+
+        Raises :class:`BlockingIOError` when no datagram is waiting.
+        """
+        if _recvmmsg is None:
+            nbytes, addr = sock.recvfrom_into(self._buffers[0])
+            return [(self._views[0], nbytes, addr)]
+
+        msgs = self._msgs
+        for i in range(self._count):
+            msgs[i].msg_hdr.msg_namelen = _SOCKADDR_SIZE
+        while True:
+            received = _recvmmsg(sock.fileno(), msgs, self._count, socket.MSG_DONTWAIT, None)
+            if received >= 0:
+                break
+            err = ctypes.get_errno()
+            # ctypes calls do not get Python's automatic EINTR retry.
+            if err != errno.EINTR:
+                raise OSError(err, os.strerror(err))
+
+        names = self._names
+        results = []
+        for i in range(received):
+            start = i * _SOCKADDR_SIZE
+            msg = msgs[i]
+            addr = _parse_sockaddr(names[start:start + msg.msg_hdr.msg_namelen])
+            results.append((self._views[i], msg.msg_len, addr))
+        return results
@@ -2,23 +2,21 @@
 
 from __future__ import annotations
 
+import ipaddress
 import struct
 import time
 import socket
 import threading
+from array import array
 
 from typing import Iterable
 
 from . import dsu_packet as packet
 from .dsu_constants import (
     DSU_version_request,
-    DSU_version_response,
     DSU_list_ports,
-    DSU_port_info,
     DSU_button_request,
-    DSU_button_response,
     DSU_motor_request,
-    DSU_motor_response,
     motor_command,
     PROTOCOL_VERSION,
 )
@@ -26,21 +24,42 @@ from .dsu_constants import (
 # not sit inside a larger package hierarchy so moving up a level via a relative
 # import fails when this module is executed directly.
 from libraries import net_config as net_cfg
+from libraries import udp_batch
 from libraries.masks import ControllerStateDict
 
+# Request header followed by the message type: magic, protocol version,
+# payload length, CRC32, client ID and message type.
+_REQUEST_HEADER = struct.Struct("<4sHHIII")
+
+# Placeholder in ``DSUProtocol._prev_connection_types`` for slots with no
+# recorded connection type change.
+_UNSEEN = -0x8000
+
+# Request handlers by message type. Each is called as
+# ``handler(addr, data, protocol_version)``.
+_HANDLERS = {
+    DSU_version_request: packet.handle_version_request,
+    DSU_list_ports: packet.handle_list_ports,
+    DSU_button_request: packet.handle_pad_data_request,
+    DSU_motor_request: packet.handle_motor_request,
+    motor_command: packet.handle_motor_command,
+}
+
 
 class DSUProtocol:
     """Handle DSU network traffic for the server."""
 
     def __init__(self, server_id: int | None = None) -> None:
         self.server_id = server_id
-        self._prev_connection_types: dict[int, int] = {}
+        # Last connection type change recorded for each slot, indexed by slot.
+        # ``_UNSEEN`` slots fall back to the current connection type.
+        self._prev_connection_types = array('h', [_UNSEEN]) * net_cfg.soft_slot_limit
         self._idle_slots: set[int] = set()
         # DSU packets max out at a few hundred bytes (e.g. a 256-slot list
         # ports request is ~280 bytes including the header). Reserve plenty of
         # room to hold any packet without reallocations.
-        self._recv_buffer = bytearray(2048)
-        self._buffer_view = memoryview(self._recv_buffer)
+        self._receiver = udp_batch.Receiver(size=2048)
+        self._verify_crc = True
 
     def initialize(
         self,
@@ -50,10 +69,21 @@ class DSUProtocol:
         idle_slots: Iterable[int] | None = None,
     ) -> None:
         """Prepare the protocol state for a running server."""
+        # Larger kernel buffers absorb request bursts and queued input
+        # reports between ticks. The OS may clamp or ignore the request.
+        for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, net_cfg.socket_buffer_size)
+            except OSError:
+                pass
+        try:
+            loopback = ipaddress.ip_address(sock.getsockname()[0]).is_loopback
+        except (OSError, ValueError):
+            loopback = False
+        self._verify_crc = net_cfg.verify_crc or not loopback
         packet.start_sender(sock, stop_event)
         packet.controller_states = controller_states
         if self.server_id is not None:
-            packet.server_id = self.server_id
             net_cfg.server_id = self.server_id
         if idle_slots is not None:
             self._idle_slots = set(idle_slots)
@@ -62,171 +92,164 @@ class DSUProtocol:
 
     def handle_requests(self, sock: socket.socket) -> None:
         """Process any pending DSU requests from ``sock``."""
-        recv_buffer = self._recv_buffer
-        buffer_view = self._buffer_view
+        receiver = self._receiver
         try:
             while True:
-                bytes_read, addr = sock.recvfrom_into(recv_buffer)
-                if bytes_read < 20 or recv_buffer[:4] != b"DSUC":
-                    continue
-
-                data_view = buffer_view[:bytes_read]
-                try:
-                    _, version, declared_length, recv_crc, _ = struct.unpack(
-                        "<4sHHII", data_view[:16]
-                    )
-                except struct.error:
-                    continue
-
-                if version > PROTOCOL_VERSION:
-                    continue
-                if declared_length < 4:
-                    continue
-                if declared_length != bytes_read - 16:
-                    continue
-
-                msg = data_view[16:]
-                computed_crc = packet.crc_packet(data_view[:16], msg)
-                if computed_crc != recv_crc:
-                    continue
-
-                negotiated_version = min(version, PROTOCOL_VERSION)
-                data = data_view
-                info = net_cfg.ensure_client(addr)
-                info["protocol_version"] = negotiated_version
-
-                msg_type, = struct.unpack("<I", msg[:4])
-                if msg_type == DSU_version_request:
-                    packet.handle_version_request(addr, negotiated_version)
-                elif msg_type == DSU_list_ports:
-                    packet.handle_list_ports(addr, data, protocol_version=negotiated_version)
-                elif msg_type == DSU_button_request:
-                    packet.handle_pad_data_request(addr, data)
-                elif msg_type == DSU_motor_request:
-                    packet.handle_motor_request(addr, data, protocol_version=negotiated_version)
-                elif msg_type == motor_command:
-                    packet.handle_motor_command(addr, data)
+                for view, bytes_read, addr in receiver.recv(sock):
+                    try:
+                        self._handle_packet(view, bytes_read, addr)
+                    except Exception as exc:
+                        print(f"Error processing packet: {exc}")
         except BlockingIOError:
             pass
         except ConnectionResetError:
             pass
-        except Exception as exc:
-            print(f"Error processing packet: {exc}")
+        except OSError as exc:
+            # e.g. an oversized datagram on Windows; leave the rest for the
+            # next pass rather than taking the server loop down.
+            print(f"Error receiving packet: {exc}")
+        packet.flush_pending()
+
+    def _handle_packet(self, view: memoryview, bytes_read: int, addr) -> None:
+        """Validate one received datagram and pass it to its handler."""
+        if bytes_read < 20:
+            return
+        magic, version, declared_length, recv_crc, _, msg_type = (
+            _REQUEST_HEADER.unpack_from(view)
+        )
+        # The length check also guarantees the 4-byte message type is present.
+        if not (
+            magic == b"DSUC"
+            and version <= PROTOCOL_VERSION
+            and declared_length == bytes_read - 16
+            and declared_length >= 4
+        ):
+            return
+
+        data_view = view[:bytes_read]
+        if self._verify_crc and packet.crc_packet(data_view[:16], data_view[16:]) != recv_crc:
+            return
+
+        negotiated_version = min(version, PROTOCOL_VERSION)
+        info = net_cfg.ensure_client(addr)
+        info["protocol_version"] = negotiated_version
+
+        handler = _HANDLERS.get(msg_type)
+        if handler is not None:
+            handler(addr, data_view, negotiated_version)
 
     def update_clients(self, controller_states: ControllerStateDict) -> None:
         """Send controller state updates to connected clients."""
-        now = time.time()
-        for addr in list(net_cfg.active_clients.keys()):
-            if now - net_cfg.active_clients[addr]["last_seen"] > net_cfg.DSU_timeout:
-                del net_cfg.active_clients[addr]
-                print(f"Client {addr} timed out")
-            else:
-                info = net_cfg.ensure_client(addr)
-                regs = info["registrations"]
-                if regs.get("all") and now - regs["all"] > net_cfg.DSU_timeout:
-                    regs["all"] = 0.0
+        now_ns = time.time_ns()
+        now = now_ns / 1e9
+        # Motion timestamp for slots that don't supply their own.
+        now_us = now_ns // 1000
+        timeout = net_cfg.DSU_timeout
+        # A single pass over the clients drops expired registrations, notes
+        # timed out clients and takes the per-tick snapshot used below:
+        # (addr, protocol_version) pairs for the port announcements, plus a
+        # bitmask per client of the slots it has a live input registration
+        # for (bit ``s`` = slot ``s``).
+        packet.drop_failed_clients()
+        last_seen = net_cfg.client_last_seen
+        expired = []
+        clients = []
+        slot_masks = []
+        mac_masks = None
+        for addr, info in list(net_cfg.active_clients.items()):
+            seen = last_seen.get(addr)
+            if seen is None or now - seen > timeout:
+                expired.append(addr)
+                continue
+            clients.append((addr, info["protocol_version"]))
+            regs = info["registrations"]
+            if regs["all"] and now - regs["all"] > timeout:
+                regs["all"] = 0.0
+            if regs["slots"]:
                 regs["slots"] = {
                     slot: ts
-                    for slot, ts in regs.get("slots", {}).items()
-                    if now - ts <= net_cfg.DSU_timeout
+                    for slot, ts in regs["slots"].items()
+                    if now - ts <= timeout
                 }
+            if regs["macs"]:
                 regs["macs"] = {
                     mac: ts
-                    for mac, ts in regs.get("macs", {}).items()
-                    if now - ts <= net_cfg.DSU_timeout
+                    for mac, ts in regs["macs"].items()
+                    if now - ts <= timeout
                 }
+            if regs["all"]:
+                slot_masks.append(-1)
+                continue
+            mask = 0
+            for slot in regs["slots"]:
+                mask |= 1 << slot
+            if regs["macs"]:
+                if mac_masks is None:
+                    mac_masks = {}
+                    for slot in list(controller_states):
+                        mac = net_cfg.slot_mac_addresses[slot]
+                        mac_masks[mac] = mac_masks.get(mac, 0) | (1 << slot)
+                for mac in regs["macs"]:
+                    mask |= mac_masks.get(mac, 0)
+            slot_masks.append(mask)
+        for addr in expired:
+            net_cfg.drop_client(addr)
+            print(f"Client {addr} timed out")
 
         for s, state in list(controller_states.items()):
             prev_connected = state.connected
-            prev_type = self._prev_connection_types.get(s, state.connection_type)
+            prev_types = self._prev_connection_types
+            if s >= len(prev_types):
+                prev_types.extend([_UNSEEN] * (s + 1 - len(prev_types)))
+            prev_type = prev_types[s]
+            if prev_type == _UNSEEN:
+                prev_type = state.connection_type
             if s in self._idle_slots:
-                state.connected = True
+                if not state.connected:
+                    state.connected = True
             else:
                 state.update_connection(net_cfg.stick_deadzone)
 
             if state.connection_type != prev_type:
-                self._prev_connection_types[s] = state.connection_type
+                prev_types[s] = state.connection_type
                 if state.connection_type == -1:
                     state.connected = False
-                    net_cfg.known_slots.discard(s)
-                    for client in list(net_cfg.active_clients):
-                        client_info = net_cfg.active_clients.get(client, {})
-                        packet.send_port_disconnect(
-                            client,
-                            s,
-                            protocol_version=client_info.get("protocol_version"),
-                        )
+                    net_cfg.known_slots &= ~(1 << s)
+                    for client, protocol_version in clients:
+                        packet.send_port_disconnect(client, s, protocol_version=protocol_version)
                 else:
-                    net_cfg.known_slots.add(s)
-                    for client in list(net_cfg.active_clients):
-                        client_info = net_cfg.active_clients.get(client, {})
-                        packet.send_port_info(
-                            client,
-                            s,
-                            protocol_version=client_info.get("protocol_version"),
-                        )
+                    net_cfg.known_slots |= 1 << s
+                    for client, protocol_version in clients:
+                        packet.send_port_info(client, s, protocol_version=protocol_version)
 
             if (
                 state.connection_type != -1
                 and not prev_connected
                 and state.connected
-                and s not in net_cfg.known_slots
+                and not (net_cfg.known_slots >> s) & 1
             ):
-                net_cfg.known_slots.add(s)
-                for client in list(net_cfg.active_clients):
-                    client_info = net_cfg.active_clients.get(client, {})
-                    packet.send_port_info(
-                        client,
-                        s,
-                        protocol_version=client_info.get("protocol_version"),
-                    )
+                net_cfg.known_slots |= 1 << s
+                for client, protocol_version in clients:
+                    packet.send_port_info(client, s, protocol_version=protocol_version)
             if state.connection_type != -1:
-                mac_address = net_cfg.slot_mac_addresses[s]
-                for addr in list(net_cfg.active_clients):
-                    info = net_cfg.ensure_client(addr)
-                    regs = info.get("registrations", {})
-                    all_ts = regs.get("all", 0.0)
-                    slot_ts = regs.get("slots", {}).get(s)
-                    mac_ts = regs.get("macs", {}).get(mac_address)
-                    if (
-                        (all_ts and now - all_ts <= net_cfg.DSU_timeout)
-                        or (slot_ts and now - slot_ts <= net_cfg.DSU_timeout)
-                        or (mac_ts and now - mac_ts <= net_cfg.DSU_timeout)
-                    ):
-                        packet.send_input(
-                            addr,
-                            s,
-                            connected=state.connected,
-                            packet_num=state.packet_num,
-                            buttons1=state.buttons1,
-                            buttons2=state.buttons2,
-                            home=state.home,
-                            touch_button=state.touch_button,
-                            L_stick=state.L_stick,
-                            R_stick=state.R_stick,
-                            dpad_analog=state.dpad_analog,
-                            face_analog=state.face_analog,
-                            analog_R1=state.analog_R1,
-                            analog_L1=state.analog_L1,
-                            analog_R2=state.analog_R2,
-                            analog_L2=state.analog_L2,
-                            touchpad_input1=state.touchpad_input1,
-                            touchpad_input2=state.touchpad_input2,
-                            motion_timestamp=state.motion_timestamp,
-                            accelerometer=state.accelerometer,
-                            gyroscope=state.gyroscope,
-                            connection_type=state.connection_type,
-                            battery=state.battery,
-                            protocol_version=info.get("protocol_version"),
-                        )
+                targets = [
+                    client
+                    for client, mask in zip(clients, slot_masks)
+                    if (mask >> s) & 1
+                ]
+                if targets:
+                    packet.broadcast_state(targets, s, state, now_us)
         for state in list(controller_states.values()):
-            state.packet_num = (state.packet_num + 1) & 0xFFFFFFFF
-            motors = list(state.motors)
-            timestamps = list(state.motor_timestamps)
+            state.advance_packet_num()
+            motors = state.motors
+            # Most slots have no rumble active; skip the per-motor scan then.
+            if not any(motors):
+                continue
+            timestamps = state.motor_timestamps
             for i in range(state.motor_count):
-                if now - timestamps[i] > net_cfg.DSU_timeout and motors[i] != 0:
+                if motors[i] != 0 and now - timestamps[i] > timeout:
                     motors[i] = 0
-            state.motors = tuple(motors)
+        packet.flush_pending()
 
     def shutdown(self) -> None:
         """Clean up protocol specific state."""
@@ -1,15 +1,17 @@
+import functools
 import logging
 import struct
 import zlib
 import time
-import queue
 import threading
 import socket
+from collections import deque
 
 # Import libraries from the project root. These modules are not part of a
 # package hierarchy above ``protocols`` so absolute imports are required when
 # this file is executed as part of the application.
 from libraries import net_config as net_cfg
+from libraries import udp_batch
 from libraries.masks import button_mask_1, button_mask_2, touchpad_input
 from .dsu_constants import (
     DSU_port_info,
@@ -20,64 +22,145 @@ from .dsu_constants import (
 )
 
 
+# Placeholder for the CRC field while the checksum is computed.
+_ZERO_CRC = b"\x00\x00\x00\x00"
+
+
 def crc_packet(header: bytes | memoryview, payload: bytes | memoryview) -> int:
     """Return CRC32 for a packet.
 
-    ``header`` and ``payload`` may be any object supporting the buffer protocol.
-    They are converted to :class:`bytes` slices to ensure compatibility when the
-    caller provides a ``memoryview`` (e.g. when parsing packets directly from a
-    receive buffer).
+    ``header`` and ``payload`` may be any object supporting the buffer protocol
+    (e.g. a ``memoryview`` into a receive buffer). The CRC field of the header
+    is treated as zero. The checksum is fed to :func:`zlib.crc32` in pieces so
+    no concatenated copy of the packet is built.
     """
     header_view = memoryview(header)
-    payload_view = memoryview(payload)
-    data = (
-        header_view[:8].tobytes()
-        + b"\x00\x00\x00\x00"
-        + header_view[12:].tobytes()
-        + payload_view.tobytes()
-    )
-    return zlib.crc32(data) & 0xFFFFFFFF
+    crc = zlib.crc32(header_view[:8])
+    crc = zlib.crc32(_ZERO_CRC, crc)
+    crc = zlib.crc32(header_view[12:], crc)
+    return zlib.crc32(payload, crc) & 0xFFFFFFFF
+
+
+# Request fields following the message type: registration flags, slot and
+# MAC address for pad data requests; slot, motor id and intensity for motor
+# commands.
+_PAD_REQUEST = struct.Struct('<BB6s')
+_MOTOR_COMMAND = struct.Struct('<B6xBB')
+
+# Slot description shared by port info, motor count and input reports: slot,
+# slot state, device model, connection type, MAC address, battery and a
+# trailing byte (active flag for port info and input, motor count for motor
+# responses).
+_SLOT_INFO = struct.Struct('<4B6s2B')
+_VERSION_BODY = struct.Struct('<H')
+
+# Input report fields following the slot description: packet counter,
+# buttons and analog values, two touch points, motion timestamp and
+# accelerometer/gyro readings.
+_INPUT_BODY = struct.Struct('<I20B2B2H2B2HQ6f')
+
+# Packet header and the offsets used when assembling packets in place.
+_HEADER = struct.Struct('<4sHHII')
+_UINT32 = struct.Struct('<I')
+_MSG_OFFSET = 16
+_PAYLOAD_OFFSET = 20
+_INPUT_PREFIX_SIZE = 12
+_INPUT_LENGTH = 4 + _INPUT_PREFIX_SIZE + _INPUT_BODY.size
+
+# Scratch buffer for input reports. Packets are assembled here and copied
+# out once, so only the server thread may call build_input_packet. The
+# header is written last, once its CRC is known.
+_input_buf = bytearray(_MSG_OFFSET + _INPUT_LENGTH)
+_input_view = memoryview(_input_buf)
+_UINT32.pack_into(_input_buf, _MSG_OFFSET, DSU_button_response)
+
+# Touchpad payload used when a slot has no touch data.
+_NEUTRAL_TOUCH = touchpad_input()
 
 # Socket used for sending packets. The server assigns this when initialized.
 sock = None
 # Controller state mapping assigned by the server
 controller_states = None
 
-# Queue and thread for asynchronous packet sends
-send_queue: queue.Queue[tuple[bytes, tuple[str, int], str | None] | None] | None = None
+# Queue and thread for asynchronous packet sends. Each queue item is a batch
+# of ``(packet, addr, desc)`` entries collected by :func:`queue_packet` and
+# handed to the sender by :func:`flush_pending`. The server thread is the
+# only producer and the sender the only consumer, so the deque's atomic
+# append/popleft need no lock; ``_send_ready`` wakes the sender.
+send_queue: deque[list[tuple[bytes, tuple[str, int], str | None]] | None] | None = None
 send_thread: threading.Thread | None = None
 _send_stop: threading.Event | None = None
+_send_ready = threading.Event()
+_pending: list[tuple[bytes, tuple[str, int], str | None]] = []
+# Addresses the sender thread failed to reach, awaiting removal by the
+# server thread.
+_failed_clients: deque[tuple[str, int]] = deque()
+
+
+def _report_send_failure(addr, desc: str | None, exc: OSError) -> None:
+    if desc:
+        print(f"Failed to send {desc} to {addr}: {exc}")
+    else:
+        print(f"Failed to send packet to {addr}: {exc}")
+    # The server thread owns the client tables; it drops the client on its
+    # next tick through drop_failed_clients.
+    _failed_clients.append(addr)
+
+
+def drop_failed_clients() -> None:
+    """Forget clients whose sends failed since the last call.
+
+    Called from the server thread so client tables are only changed there.
+    """
+    while _failed_clients:
+        addr = _failed_clients.popleft()
+        if net_cfg.drop_client(addr):
+            print(f"Removed client {addr} after send failure")
+
+
+def _send_packets(send_sock: socket.socket, batch) -> None:
+    """Send ``batch`` using as few syscalls as the platform allows."""
+    send_batch = udp_batch.send_batch
+    step = udp_batch.MAX_BATCH
+    i = 0
+    while i < len(batch):
+        chunk = [(pkt, addr) for pkt, addr, _ in batch[i:i + step]]
+        try:
+            i += send_batch(send_sock, chunk)
+        except OSError as exc:
+            _, addr, desc = batch[i]
+            _report_send_failure(addr, desc, exc)
+            i += 1
 
 
 def start_sender(send_sock: socket.socket, stop_event: threading.Event) -> None:
     """Start a background thread that flushes queued packets."""
     global sock, send_queue, send_thread, _send_stop
     sock = send_sock
-    send_queue = queue.Queue()
+    send_queue = deque()
     _send_stop = stop_event
+    _send_ready.clear()
+    _pending.clear()
+    _failed_clients.clear()
 
     def _worker() -> None:
         assert send_queue is not None and _send_stop is not None
+        batches = send_queue
         while not _send_stop.is_set():
-            item = send_queue.get()
-
-            if item is None or _send_stop.is_set():
-                if item is not None:
-                    send_queue.task_done()
-                break
-
-            pkt, addr, desc = item
-            try:
-                send_sock.sendto(pkt, addr)
-            except OSError as exc:
-                if desc:
-                    print(f"Failed to send {desc} to {addr}: {exc}")
-                else:
-                    print(f"Failed to send packet to {addr}: {exc}")
-                if net_cfg.active_clients.pop(addr, None) is not None:
-                    print(f"Removed client {addr} after send failure")
-            finally:
-                send_queue.task_done()
+            if not _send_ready.wait(0.1):
+                continue
+            # Clear before draining so a batch appended after the deque is
+            # found empty sets the event again for the next pass.
+            _send_ready.clear()
+            while batches:
+                batch = batches.popleft()
+                if batch is None or _send_stop.is_set():
+                    return
+                # Fold in any batches that queued up meanwhile so they share
+                # ``sendmmsg`` calls.
+                while batches and batches[0] is not None and len(batch) < udp_batch.MAX_BATCH:
+                    batch = batch + batches.popleft()
+                _send_packets(send_sock, batch)
 
     send_thread = threading.Thread(target=_worker, daemon=True)
     send_thread.start()
@@ -87,84 +170,140 @@ def stop_sender() -> None:
     """Join the sender thread if running."""
     if send_thread is not None:
         if send_queue is not None:
-            send_queue.put(None)
+            send_queue.append(None)
+            _send_ready.set()
         send_thread.join()
 
 
 def queue_packet(pkt: bytes, addr: tuple[str, int], desc: str | None = None) -> None:
-    """Queue a packet for asynchronous sending."""
+    """Queue a packet for sending on the next :func:`flush_pending`.
+
+    Without a running sender thread the packet is sent immediately.
+    """
     if send_queue is None:
-        try:
-            sock.sendto(pkt, addr)
-        except OSError as exc:
-            if desc:
-                print(f"Failed to send {desc} to {addr}: {exc}")
-            else:
-                print(f"Failed to send packet to {addr}: {exc}")
-            if net_cfg.active_clients.pop(addr, None) is not None:
-                print(f"Removed client {addr} after send failure")
+        _send_packets(sock, [(pkt, addr, desc)])
         return
 
-    send_queue.put((pkt, addr, desc))
+    _pending.append((pkt, addr, desc))
+
+
+def flush_pending() -> None:
+    """Hand all packets queued since the last flush to the sender thread."""
+    global _pending
+    if not _pending or send_queue is None:
+        return
+    batch, _pending = _pending, []
+    send_queue.append(batch)
+    _send_ready.set()
+
+
+@functools.lru_cache(maxsize=64)
+def _header_crc(version: int, length: int, server_id: int) -> int:
+    """Return the running CRC32 of a server header with a zeroed CRC field.
+
+    Only the protocol version, message length and server ID vary between
+    outgoing headers, so the checksum of the 16 header bytes is cached and
+    used to seed the CRC of each message body.
+    """
+    return zlib.crc32(_HEADER.pack(b'DSUS', version, length, 0, server_id))
 
 
 def build_header(msg_type: int, payload: bytes, protocol_version: int | None = None) -> bytes:
     """Build a DSU packet header for ``msg_type`` and ``payload``."""
     version = PROTOCOL_VERSION if protocol_version is None else protocol_version
-    msg = struct.pack('<I', msg_type) + payload
-    length = len(msg)
-    header = struct.pack('<4sHHII', b'DSUS', version, length, 0, net_cfg.server_id)
-    crc = crc_packet(header, msg)
-    header = struct.pack('<4sHHII', b'DSUS', version, length, crc, net_cfg.server_id)
-    return header + msg
-
-
-def send_port_info(addr, slot, protocol_version: int | None = None):
-    if slot >= net_cfg.soft_slot_limit:
-        print("Warning: slots above 255 cannot be reported to the client")
-        return
-    state = controller_states[slot]
-    if state.connection_type == -1:
+    msg_type_bytes = _UINT32.pack(msg_type)
+    length = 4 + len(payload)
+    server_id = net_cfg.server_id
+    crc = zlib.crc32(msg_type_bytes, _header_crc(version, length, server_id))
+    crc = zlib.crc32(payload, crc) & 0xFFFFFFFF
+    header = _HEADER.pack(b'DSUS', version, length, crc, server_id)
+    return b"".join((header, msg_type_bytes, payload))
+
+
+@functools.lru_cache(maxsize=1024)
+def _port_info_packet(
+    slot: int,
+    connection_type: int,
+    mac_address: bytes,
+    battery: int,
+    protocol_version: int | None,
+    server_id: int,
+) -> bytes:
+    """Return the port info packet describing a slot.
+
+    Port info only changes with the slot's connection type, MAC address and
+    battery level, so finished packets are cached by those values.
+    """
+    if connection_type == -1:
         payload = b"\x00" * 12
     else:
-        mac_address = net_cfg.slot_mac_addresses[slot]
-        payload = struct.pack(
-            '<4B6s2B',
+        payload = _SLOT_INFO.pack(
             slot,
             2,  # slot state - connected
             2,  # device model - full gyro
-            state.connection_type,
+            connection_type,
             mac_address,
-            state.battery,
+            battery,
             0,  # reserved/isActive
         )
-    packet = build_header(DSU_port_info, payload, protocol_version=protocol_version)
-    queue_packet(packet, addr, f"port info slot {slot}")
+    return build_header(DSU_port_info, payload, protocol_version=protocol_version)
 
 
-def send_port_disconnect(addr, slot, protocol_version: int | None = None):
-    """Send a port info packet indicating the slot is disconnected."""
+def send_port_info(addr, slot, protocol_version: int | None = None):
     if slot >= net_cfg.soft_slot_limit:
         print("Warning: slots above 255 cannot be reported to the client")
         return
+    state = controller_states[slot]
+    packet = _port_info_packet(
+        slot,
+        state.connection_type,
+        net_cfg.slot_mac_addresses[slot],
+        state.battery,
+        protocol_version,
+        net_cfg.server_id,
+    )
+    queue_packet(packet, addr, f"port info slot {slot}")
+
+
+@functools.lru_cache(maxsize=1024)
+def _port_disconnect_packet(slot: int, protocol_version: int | None, server_id: int) -> bytes:
+    """Return the port info packet reporting ``slot`` as disconnected.
+
+    The packet only depends on its arguments, so it is built once and reused
+    for every client. ``server_id`` is part of the cache key so a new server
+    ID produces fresh packets.
+    """
     # Include the slot number in the payload so clients know which
     # controller was disconnected. Older behaviour filled the entire
     # payload with zeros which always reported slot 0, leading clients
     # to believe an extra controller existed.
-    payload = struct.pack("<4B6s2B", slot, 0, 0, 0, b"\x00" * 6, 0, 0)
-    packet = build_header(DSU_port_info, payload, protocol_version=protocol_version)
-    queue_packet(packet, addr, f"port disconnect slot {slot}")
+    payload = _SLOT_INFO.pack(slot, 0, 0, 0, b"\x00" * 6, 0, 0)
+    return build_header(DSU_port_info, payload, protocol_version=protocol_version)
 
 
-def handle_version_request(addr, protocol_version: int):
-    payload = struct.pack('<H', PROTOCOL_VERSION)
-    packet = build_header(
+@functools.lru_cache(maxsize=16)
+def _version_packet(protocol_version: int | None, server_id: int) -> bytes:
+    """Return the version response packet for ``protocol_version``."""
+    payload = _VERSION_BODY.pack(PROTOCOL_VERSION)
+    return build_header(
         DSU_version_response,
         payload,
         protocol_version=protocol_version,
     )
-    info = net_cfg.ensure_client(addr)
-    info['last_seen'] = time.time()
+
+
+def send_port_disconnect(addr, slot, protocol_version: int | None = None):
+    """Send a port info packet indicating the slot is disconnected."""
+    if slot >= net_cfg.soft_slot_limit:
+        print("Warning: slots above 255 cannot be reported to the client")
+        return
+    packet = _port_disconnect_packet(slot, protocol_version, net_cfg.server_id)
+    queue_packet(packet, addr, f"port disconnect slot {slot}")
+
+
+def handle_version_request(addr, data=None, protocol_version: int | None = None):
+    packet = _version_packet(protocol_version, net_cfg.server_id)
+    net_cfg.touch_client(addr)
     queue_packet(packet, addr, "version response")
 
 
@@ -172,36 +311,30 @@ def handle_list_ports(addr, data, protocol_version: int | None = None):
     """Respond to a list ports request."""
     if len(data) < 24:
         return
-    info = net_cfg.ensure_client(addr)
-    info['last_seen'] = time.time()
-    count, = struct.unpack_from('<I', data, 20)
-    slots = data[24:24 + count]
-    for slot in slots:
-        if slot in net_cfg.known_slots:
+    net_cfg.touch_client(addr)
+    count, = _UINT32.unpack_from(data, _PAYLOAD_OFFSET)
+    known_slots = net_cfg.known_slots
+    for slot in data[24:24 + count]:
+        if (known_slots >> slot) & 1:
             send_port_info(addr, slot, protocol_version=protocol_version)
         else:
             send_port_disconnect(addr, slot, protocol_version=protocol_version)
 
 
-def handle_pad_data_request(addr, data):
+def handle_pad_data_request(addr, data, protocol_version: int | None = None):
     if len(data) < 28:
         return
-    reg_flags = data[20]
-    requested_slot = data[21]
-    mac = bytes(data[22:28])
-    info = net_cfg.ensure_client(addr)
-    info['last_seen'] = time.time()
-    info['registrations'].setdefault('slots', {})
-    info['registrations'].setdefault('macs', {})
+    reg_flags, requested_slot, mac = _PAD_REQUEST.unpack_from(data, 20)
     now = time.time()
+    info = net_cfg.touch_client(addr, now)
     if reg_flags == 0:
         info['registrations']['all'] = now
     if reg_flags & 0x01:
         info['registrations']['slots'][requested_slot] = now
-        info['slots'].add(requested_slot)
+        info['slots'] |= 1 << requested_slot
         state = controller_states.get(requested_slot)
         if state is not None and state.connected:
-            net_cfg.known_slots.add(requested_slot)
+            net_cfg.known_slots |= 1 << requested_slot
         if requested_slot not in net_cfg.logged_pad_requests:
             print(f"Registered input request from {addr} for slot {requested_slot}")
             net_cfg.logged_pad_requests.add(requested_slot)
@@ -217,61 +350,142 @@ def handle_motor_request(addr, data, protocol_version: int | None = None):
     if slot >= net_cfg.soft_slot_limit:
         print("Warning: slots above 255 cannot be reported to the client")
         return
-    info = net_cfg.ensure_client(addr)
-    info['last_seen'] = time.time()
-    info['slots'].add(slot)
+    info = net_cfg.touch_client(addr)
+    info['slots'] |= 1 << slot
     state = controller_states.get(slot)
     if (
         state is None
         or state.connection_type == -1
         or not state.connected
-        or slot not in net_cfg.known_slots
+        or not (net_cfg.known_slots >> slot) & 1
     ):
-        payload = struct.pack('<4B6s2B', slot, 0, 0, 0, b"\x00" * 6, 0, 0)
+        payload = _SLOT_INFO.pack(slot, 0, 0, 0, b"\x00" * 6, 0, 0)
         packet = build_header(DSU_motor_response, payload, protocol_version=protocol_version)
         queue_packet(packet, addr, f"motor count slot {slot} (disconnected)")
         return
 
     mac_address = net_cfg.slot_mac_addresses[slot]
-    motor_count = state.motor_count
-    payload = struct.pack(
-        '<4B6sB',
+    payload = _SLOT_INFO.pack(
         slot,
         2,  # slot state - connected
         2,  # device model - full gyro
         state.connection_type,
         mac_address,
         state.battery,
+        state.motor_count,
     )
-    payload += struct.pack('<B', motor_count)
     packet = build_header(DSU_motor_response, payload, protocol_version=protocol_version)
     queue_packet(packet, addr, f"motor count slot {slot}")
 
 
-def handle_motor_command(addr, data):
+def handle_motor_command(addr, data, protocol_version: int | None = None):
     """Update rumble motor intensity for a controller slot."""
     if len(data) < 30:
         return
-    slot = data[21]
-    info = net_cfg.ensure_client(addr)
-    info['last_seen'] = time.time()
-    info['slots'].add(slot)
-    motor_id = data[28]
-    intensity = data[29]
+    slot, motor_id, intensity = _MOTOR_COMMAND.unpack_from(data, 21)
+    now = time.time()
+    info = net_cfg.touch_client(addr, now)
+    info['slots'] |= 1 << slot
     state = controller_states.get(slot)
     if state is None or motor_id >= state.motor_count:
         return
-    motors = list(state.motors)
-    timestamps = list(state.motor_timestamps)
-    motors[motor_id] = intensity
-    timestamps[motor_id] = time.time()
-    state.motors = tuple(motors)
-    state.motor_timestamps = tuple(timestamps)
-    print(f"Rumble motor {motor_id} of slot {slot} set to {intensity}")
+    state.motors[motor_id] = intensity
+    state.motor_timestamps[motor_id] = now
+    logging.debug("Rumble motor %d of slot %d set to %d", motor_id, slot, intensity)
+
+
+@functools.lru_cache(maxsize=1024)
+def _input_prefix(slot, connection_type, mac_address, battery, connected) -> bytes:
+    """Return the slot description that starts an input report.
+
+    These fields rarely change between packets, so the packed bytes are
+    cached per distinct combination.
+    """
+    return _SLOT_INFO.pack(
+        slot,
+        2,  # slot state - connected
+        2,  # device model - full gyro
+        connection_type,
+        mac_address,
+        battery,
+        int(connected),
+    )
+
+
+def _pack_input(
+    slot,
+    version,
+    connected,
+    counter,
+    buttons1,
+    buttons2,
+    home,
+    touch_button,
+    L_stick,
+    R_stick,
+    dpad_analog,
+    face_analog,
+    analog_R1,
+    analog_L1,
+    analog_R2,
+    analog_L2,
+    touch1,
+    touch2,
+    motion_ts,
+    accelerometer,
+    gyroscope,
+    connection_type,
+    battery,
+) -> bytes:
+    """Pack an input report from already normalised, positional fields."""
+    mac_address = net_cfg.slot_mac_addresses[slot]
+    ls_x, ls_y = L_stick
+    rs_x, rs_y = R_stick
+    dpad_up, dpad_right, dpad_down, dpad_left = dpad_analog
+    accel_x, accel_y, accel_z = accelerometer
+
+    server_id = net_cfg.server_id
+    buf = _input_buf
+    body_offset = _PAYLOAD_OFFSET + _INPUT_PREFIX_SIZE
+    buf[_PAYLOAD_OFFSET:body_offset] = _input_prefix(
+        slot, connection_type, mac_address, battery, bool(connected)
+    )
+    _INPUT_BODY.pack_into(
+        buf,
+        body_offset,
+        counter,
+        buttons1,
+        buttons2,
+        int(home),
+        int(touch_button),
+        ls_x,
+        255 - ls_y,
+        rs_x,
+        255 - rs_y,
+        dpad_left,
+        dpad_down,
+        dpad_right,
+        dpad_up,
+        *face_analog,
+        analog_R1,
+        analog_L1,
+        analog_R2,
+        analog_L2,
+        *touch1,
+        *touch2,
+        motion_ts,
+        accel_x,
+        accel_y,
+        -accel_z,
+        *gyroscope,
+    )
+    seed = _header_crc(version, _INPUT_LENGTH, server_id)
+    crc = zlib.crc32(_input_view[_MSG_OFFSET:], seed) & 0xFFFFFFFF
+    _HEADER.pack_into(buf, 0, b'DSUS', version, _INPUT_LENGTH, crc, server_id)
+    return bytes(buf)
 
 
-def send_input(
-    addr,
+def build_input_packet(
     slot,
     connected=True,
     packet_num=0,
@@ -296,78 +510,156 @@ def send_input(
     connection_type=2,
     battery=5,
     protocol_version: int | None = None,
-):
+) -> bytes:
+    """Return a complete input response packet for ``slot``.
+
+    The packet does not depend on the recipient, so the same bytes can be
+    queued for every client subscribed to the slot.
+    """
+    return _pack_input(
+        slot,
+        PROTOCOL_VERSION if protocol_version is None else protocol_version,
+        connected,
+        packet_num,
+        buttons1,
+        buttons2,
+        home,
+        touch_button,
+        L_stick,
+        R_stick,
+        dpad_analog,
+        face_analog,
+        analog_R1,
+        analog_L1,
+        analog_R2,
+        analog_L2,
+        _NEUTRAL_TOUCH if touchpad_input1 is None else touchpad_input1,
+        _NEUTRAL_TOUCH if touchpad_input2 is None else touchpad_input2,
+        motion_timestamp or time.time_ns() // 1000,
+        accelerometer,
+        gyroscope,
+        connection_type,
+        battery,
+    )
+
+
+def build_state_packet(slot, state, motion_timestamp: int, protocol_version: int | None = None) -> bytes:
+    """Return the input report for ``slot`` straight from a ``ControllerState``.
+
+    ``motion_timestamp`` is used when the state does not carry its own.
+    This is the per-tick path used by the server loop; it reads ``state``
+    attributes directly instead of going through keyword arguments.
+    """
+    touch1 = state.touchpad_input1
+    touch2 = state.touchpad_input2
+    return _pack_input(
+        slot,
+        PROTOCOL_VERSION if protocol_version is None else protocol_version,
+        state.connected,
+        state.packet_num,
+        state.buttons1,
+        state.buttons2,
+        state.home,
+        state.touch_button,
+        state.L_stick,
+        state.R_stick,
+        state.dpad_analog,
+        state.face_analog,
+        state.analog_R1,
+        state.analog_L1,
+        state.analog_R2,
+        state.analog_L2,
+        _NEUTRAL_TOUCH if touch1 is None else touch1,
+        _NEUTRAL_TOUCH if touch2 is None else touch2,
+        state.motion_timestamp or motion_timestamp,
+        state.accelerometer,
+        state.gyroscope,
+        state.connection_type,
+        state.battery,
+    )
+
+
+def _queue_input(targets, slot, connected, buttons1, buttons2, build) -> None:
+    """Queue input reports built by ``build(protocol_version)`` to ``targets``."""
     if slot >= net_cfg.soft_slot_limit:
         print("Warning: slots above 255 cannot be reported to the client")
         return
-    if slot not in net_cfg.known_slots:
+    if not (net_cfg.known_slots >> slot) & 1:
         if not connected:
             return
-        net_cfg.known_slots.add(slot)
-        for client in list(net_cfg.active_clients):
-            client_info = net_cfg.active_clients.get(client, {})
-            send_port_info(client, slot, protocol_version=client_info.get("protocol_version"))
-
-    info = net_cfg.active_clients.get(addr)
-    if info is None:
+        net_cfg.known_slots |= 1 << slot
+        for client, client_info in list(net_cfg.active_clients.items()):
+            send_port_info(client, slot, protocol_version=client_info["protocol_version"])
+
+    packets: dict[int | None, bytes] = {}
+    last_addr = None
+    desc = f"input slot {slot}"
+    slot_bit = 1 << slot
+    get_client = net_cfg.active_clients.get
+    for addr, protocol_version in targets:
+        info = get_client(addr)
+        if info is None:
+            continue
+        info['slots'] |= slot_bit
+        packet = packets.get(protocol_version)
+        if packet is None:
+            packet = build(protocol_version)
+            packets[protocol_version] = packet
+        queue_packet(packet, addr, desc)
+        last_addr = addr
+    if last_addr is None:
         return
-    info['slots'].add(slot)
 
-    counter = packet_num
+    # Steady state: buttons unchanged since the last packet for this slot.
+    current_state = (buttons1 << 8) | buttons2
+    if net_cfg.last_button_states[slot] == current_state:
+        return
+    net_cfg.last_button_states[slot] = current_state
+    logging.debug(
+        "Sent input to %s slot %d: buttons1=0x%02X buttons2=0x%02X",
+        last_addr, slot, buttons1, buttons2,
+    )
 
-    motion_ts = motion_timestamp or int(time.time() * 1000000)
-    touch1 = touchpad_input1 or touchpad_input()
-    touch2 = touchpad_input2 or touchpad_input()
 
-    mac_address = net_cfg.slot_mac_addresses[slot]
-    ls_x, ls_y = L_stick
-    rs_x, rs_y = R_stick
-    dpad_up, dpad_right, dpad_down, dpad_left = dpad_analog
-    accel_x, accel_y, accel_z = accelerometer
+def broadcast_input(targets, slot, **fields):
+    """Queue one input report for ``slot`` to every client in ``targets``.
 
-    payload = struct.pack(
-        '<4B6s2B',
+    ``targets`` yields ``(addr, protocol_version)`` pairs. The packet is built
+    once per protocol version and the same bytes are queued for each client.
+    ``fields`` are forwarded to :func:`build_input_packet`.
+    """
+    _queue_input(
+        targets,
         slot,
-        2,  # slot state - connected
-        2,  # device model - full gyro
-        connection_type,
-        mac_address,
-        battery,
-        int(connected),
+        fields.get("connected", True),
+        fields.get("buttons1", 0),
+        fields.get("buttons2", 0),
+        lambda protocol_version: build_input_packet(
+            slot, protocol_version=protocol_version, **fields
+        ),
     )
-    payload += struct.pack('<I', counter)
-    payload += struct.pack(
-        '<BBBBBBBBBBBBBBBBBBBB',
-        buttons1,
-        buttons2,
-        int(home),
-        int(touch_button),
-        ls_x,
-        255 - ls_y,
-        rs_x,
-        255 - rs_y,
-        dpad_left,
-        dpad_down,
-        dpad_right,
-        dpad_up,
-        *face_analog,
-        analog_R1,
-        analog_L1,
-        analog_R2,
-        analog_L2,
+
+
+def broadcast_state(targets, slot, state, motion_timestamp: int) -> None:
+    """Queue the input report for ``state`` to every client in ``targets``.
+
+    Like :func:`broadcast_input` but built with :func:`build_state_packet`.
+    """
+    _queue_input(
+        targets,
+        slot,
+        state.connected,
+        state.buttons1,
+        state.buttons2,
+        lambda protocol_version: build_state_packet(
+            slot, state, motion_timestamp, protocol_version
+        ),
     )
-    payload += struct.pack('<2B2H', *touch1)
-    payload += struct.pack('<2B2H', *touch2)
-    payload += struct.pack('<Q', motion_ts)
-    payload += struct.pack('<6f', accel_x, accel_y, -accel_z, *gyroscope)
-    packet = build_header(DSU_button_response, payload, protocol_version=protocol_version)
-    queue_packet(packet, addr, f"input slot {slot}")
-
-    prev_state = net_cfg.last_button_states.get(slot)
-    current_state = (buttons1, buttons2)
-    if prev_state != current_state:
-        logging.debug(
-            "Sent input to %s slot %d: buttons1=0x%02X buttons2=0x%02X",
-            addr, slot, buttons1, buttons2,
-        )
-        net_cfg.last_button_states[slot] = current_state
+
+
+def send_input(addr, slot, *, protocol_version: int | None = None, **fields):
+    """Queue an input report for ``slot`` to ``addr``.
+
+    ``fields`` are forwarded to :func:`build_input_packet`.
+    """
+    broadcast_input(((addr, protocol_version),), slot, **fields)
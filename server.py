@@ -2,8 +2,12 @@ import time
 import socket
 import threading
 import argparse
+import logging
+import logging.handlers
 import os
-import select
+import queue
+import re
+import selectors
 
 import libraries.net_config as net_cfg
 from libraries.masks import ControllerState, ControllerStateDict
@@ -14,6 +18,54 @@ from protocols.dsu import DSUProtocol
 # connected by the server.
 IDLE = object()
 
+# Controller script options beyond the predefined slots.
+_SCRIPT_OPTION = re.compile(r"--controller(\d+)-script")
+
+
+class _WakeEvent(threading.Event):
+    """Event that also makes a socket readable while it is set.
+
+    Registering the event with a selector lets the server loop sleep until
+    either a request arrives or a controller marks its state dirty.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+
+    def fileno(self) -> int:
+        return self._reader.fileno()
+
+    def set(self) -> None:
+        # Controllers set the event on every state write; only the first
+        # write after a clear needs to wake the selector.
+        if self.is_set():
+            return
+        super().set()
+        try:
+            self._writer.send(b"\0")
+        except OSError:
+            # Full buffer (a wake-up is already pending) or closed.
+            pass
+
+    def clear(self) -> None:
+        super().clear()
+        self.drain()
+
+    def drain(self) -> None:
+        """Discard pending wake-up bytes."""
+        try:
+            while self._reader.recv(64):
+                pass
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        self._reader.close()
+        self._writer.close()
+
 
 def parse_server_id(value):
     """Parse a hex server ID ensuring it fits in 32 bits."""
@@ -28,6 +80,44 @@ def parse_server_id(value):
     return int(value, 16)
 
 
+class _RawQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves formatting to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue never leaves the process, so the record does not need
+        # to be formatted and copied into a picklable form here.
+        return record
+
+
+def configure_logging(level: str) -> logging.handlers.QueueListener:
+    """Send log records through a queue so output is written off-thread.
+
+    The server thread only enqueues records; a listener thread formats and
+    writes them. Returns the started listener so callers can stop it.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    root = logging.getLogger()
+    root.addHandler(_RawQueueHandler(log_queue))
+    root.setLevel(level)
+    listener.start()
+    return listener
+
+
+def parse_script(value):
+    """Parse a controller script option.
+
+    ``none`` leaves the slot without a controller thread and ``idle`` keeps it
+    connected without one; anything else is a script path.
+    """
+    lowered = value.lower()
+    if lowered == "none":
+        return None
+    if lowered == "idle":
+        return IDLE
+    return value
+
+
 def parse_arguments():
     """Return parsed CLI arguments."""
     parser = argparse.ArgumentParser(description="DSUwU - Server")
@@ -35,62 +125,44 @@ def parse_arguments():
     parser.add_argument("--server-id", dest="server_id",
                         type=parse_server_id,
                         help="Server identifier (hex)")
+    parser.add_argument("--log-level", dest="log_level", default="WARNING",
+                        type=str.upper,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Logging verbosity (default: WARNING)")
+    slots = set(range(0, 5))
     for i in range(0, 5):
         parser.add_argument(
             f"--controller{i}-script",
             dest=f"controller{i}_script",
+            type=parse_script,
             help=f"Path to controller {i} script",
         )
 
-    args, unknown = parser.parse_known_args()
-
-    # Collect script paths for any --controllerN-script option
-    script_map = {i: getattr(args, f"controller{i}_script") for i in range(0, 5)}
-    # Convert special strings so slots can be initialized without a controller
-    # thread or marked as always connected.
-    for slot, path in list(script_map.items()):
-        if isinstance(path, str):
-            lowered = path.lower()
-            if lowered == "none":
-                script_map[slot] = None
-            elif lowered == "idle":
-                script_map[slot] = IDLE
-    i = 0
-    while i < len(unknown):
-        opt = unknown[i]
-        if opt.startswith("--controller") and opt.endswith("-script"):
-            num = opt[len("--controller"):-len("-script")]
-            if num.isdigit():
-                slot = int(num)
-                path = None
-                if i + 1 < len(unknown) and not unknown[i + 1].startswith("--"):
-                    path = unknown[i + 1]
-                    i += 1
-                if isinstance(path, str):
-                    lowered = path.lower()
-                    if lowered == "none":
-                        path = None
-                    elif lowered == "idle":
-                        path = IDLE
-                script_map[slot] = path
-            else:
-                parser.error(f"Invalid option {opt}")
-        else:
-            parser.error(f"Unrecognized argument {opt}")
-        i += 1
-
-    # Normalize any special strings that may have come from dynamic options
-    for slot, path in list(script_map.items()):
-        if isinstance(path, str):
-            lowered = path.lower()
-            if lowered == "none":
-                script_map[slot] = None
-            elif lowered == "idle":
-                script_map[slot] = IDLE
+    # Any other --controllerN-script option is registered on the fly so the
+    # final parse handles it like the predefined ones.
+    _, unknown = parser.parse_known_args()
+    extra_options = set()
+    for opt in unknown:
+        match = _SCRIPT_OPTION.fullmatch(opt.partition("=")[0])
+        if match is None or match.group(0) in extra_options:
+            continue
+        extra_options.add(match.group(0))
+        slot = int(match.group(1))
+        parser.add_argument(
+            match.group(0),
+            dest=f"controller{slot}_script",
+            type=parse_script,
+            nargs="?",
+        )
+        slots.add(slot)
+    args = parser.parse_args()
 
     start_slot = 0
-    max_slot = max(script_map)
-    scripts = [script_map.get(i) for i in range(start_slot, max_slot + 1)]
+    max_slot = max(slots)
+    scripts = [
+        getattr(args, f"controller{i}_script", None)
+        for i in range(start_slot, max_slot + 1)
+    ]
     args.controller_scripts = scripts
     args.slot_count = len(scripts)
     args.start_slot = start_slot
@@ -126,7 +198,7 @@ def start_server(port: int = net_cfg.UDP_port,
     net_cfg.ensure_slot_count(max_slot)
 
     slot_range = range(start_slot, max_slot + 1)
-    state_dirty = threading.Event()
+    state_dirty = _WakeEvent()
     controller_states = ControllerStateDict({slot: ControllerState(connected=False) for slot in slot_range})
     controller_states._dirty_event = state_dirty
     for state in controller_states.values():
@@ -168,8 +240,7 @@ def start_server(port: int = net_cfg.UDP_port,
 
         idle_slots = {start_slot + i for i, sp in enumerate(use_scripts) if sp is IDLE}
 
-        net_cfg.known_slots.clear()
-        net_cfg.known_slots.update(idle_slots)
+        net_cfg.known_slots = sum(1 << slot for slot in idle_slots)
         for slot in list(controller_states):
             controller_states[slot].connected = slot in idle_slots
 
@@ -189,34 +260,47 @@ def start_server(port: int = net_cfg.UDP_port,
 
         protocol.initialize(sock, controller_states, stop_event, idle_slots)
 
+        # Both the socket and ``state_dirty`` are registered once; select()
+        # then reuses the kernel-side registration (epoll/kqueue where
+        # available) and sleeps until a request arrives, a controller marks
+        # its state dirty or the next keepalive is due.
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        selector.register(state_dirty, selectors.EVENT_READ)
         try:
-            update_timeout = 0.005
             _keepalive = 1 / 60.0
-            _last_update = 0.0
+            _next_keepalive = time.monotonic()
             while not stop_event.is_set():
-                readable, _, _ = select.select([sock], [], [], 0)
-
-                if stop_event.is_set():
-                    break
-
-                if readable:
-                    protocol.handle_requests(sock)
-
-                changed = state_dirty.wait(timeout=update_timeout)
+                if state_dirty.is_set():
+                    wait = 0
+                else:
+                    wait = max(_next_keepalive - time.monotonic(), 0)
+                for key, _ in selector.select(wait):
+                    if key.fileobj is sock:
+                        protocol.handle_requests(sock)
+                    else:
+                        state_dirty.drain()
                 if stop_event.is_set():
                     break
 
                 now = time.monotonic()
-                if changed or now - _last_update >= _keepalive:
+                if state_dirty.is_set() or now >= _next_keepalive:
                     protocol.update_clients(controller_states)
                     state_dirty.clear()
-                    _last_update = now
+                    # Selector timeouts round up to whole milliseconds, so a
+                    # keepalive steps from its deadline to hold 60 Hz.
+                    if _next_keepalive <= now < _next_keepalive + _keepalive:
+                        _next_keepalive += _keepalive
+                    else:
+                        _next_keepalive = now + _keepalive
         except Exception as exc:
             print(f"Server loop crashed: {exc}")
         finally:
+            selector.close()
             stop_event.set()
             for t in controller_threads:
                 t.join()
+            state_dirty.close()
             protocol.shutdown()
             sock.close()
 
@@ -228,6 +312,7 @@ def start_server(port: int = net_cfg.UDP_port,
 
 if __name__ == "__main__":
     args = parse_arguments()
+    log_listener = configure_logging(args.log_level)
     scripts = args.controller_scripts
     if not any(scripts):
         scripts = None
@@ -245,3 +330,5 @@ if __name__ == "__main__":
         print("Server shutting down.")
         stop_event.set()
         thread.join()
+    finally:
+        log_listener.stop()